@@ -0,0 +1,89 @@
+#pragma once
+#include <string>
+#include <vector>
+#include <fstream>
+#include <iterator>
+#include <stdexcept>
+#include <algorithm>
+#include <filesystem>
+
+using Grid = std::vector<std::vector<std::string>>;
+
+/**
+ * @brief Parse one CSV record starting at pos, advancing pos past its line ending
+ *
+ * @param buffer The whole file contents
+ * @param pos The offset of the first character of the record
+ * @param size_hint The expected number of fields, used to reserve the row
+ * @return std::vector<std::string> The fields of the record
+ */
+inline std::vector<std::string> parseCsvRecord(const std::string& buffer, size_t& pos, const size_t size_hint) {
+    const size_t n = buffer.size();
+    std::vector<std::string> row;
+    row.reserve(size_hint);
+
+    while (true) {
+        std::string field;
+        if (pos < n && buffer[pos] == '"') {
+            // 引號欄位，"" 代表一個引號
+            for (++pos; pos < n; ++pos) {
+                if (buffer[pos] != '"') {
+                    field += buffer[pos];
+                } else if (pos + 1 < n && buffer[pos + 1] == '"') {
+                    field += '"';
+                    ++pos;
+                } else {
+                    ++pos;
+                    break;
+                }
+            }
+        }
+
+        const size_t end = std::min(buffer.find_first_of(",\r\n", pos), n);
+        field.append(buffer, pos, end - pos);
+        row.push_back(std::move(field));
+        pos = end;
+
+        if (pos < n && buffer[pos] == ',') {
+            ++pos;
+            continue;
+        }
+        break;
+    }
+
+    if (pos < n && buffer[pos] == '\r') ++pos;
+    if (pos < n && buffer[pos] == '\n') ++pos;
+    return row;
+}
+
+/**
+ * @brief Read a CSV file into a rectangular grid of strings
+ *
+ * Blank lines are skipped, a UTF-8 BOM is ignored and short rows are padded with empty cells.
+ *
+ * @param file_path The path of the CSV file
+ * @return Grid The cells of the file, row by row
+ */
+inline Grid readCsv(const std::filesystem::path& file_path) {
+    std::ifstream file(file_path, std::ios::binary);
+    if (!file) {
+        throw std::runtime_error("Unable to open " + file_path.filename().string());
+    }
+    const std::string buffer{std::istreambuf_iterator<char>(file), std::istreambuf_iterator<char>()};
+
+    Grid rows;
+    rows.reserve(std::ranges::count(buffer, '\n') + 1);
+    size_t pos = buffer.starts_with("\xEF\xBB\xBF") ? 3 : 0;
+    while (pos < buffer.size()) {
+        if (buffer[pos] == '\r' || buffer[pos] == '\n') {
+            ++pos; // 跳过空行
+            continue;
+        }
+        rows.push_back(parseCsvRecord(buffer, pos, rows.empty()? 0: rows.back().size()));
+    }
+
+    size_t cols = 0;
+    for (const auto& row : rows) cols = std::max(cols, row.size());
+    for (auto& row : rows) row.resize(cols);
+    return rows;
+}
@@ -1,14 +1,21 @@
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
+#include <pybind11/stl/filesystem.h>
 
 #include "grid_shuffler_alg.hpp"
+#include "csv_reader.hpp"
 
 PYBIND11_MODULE(grid_shuffler, m) {
     m.doc() = "Grid shuffler algorithm for Python";
 
     pybind11::class_<GridShuffler>(m, "GridShuffler")
         .def(pybind11::init<const Grid&>())
-        .def("shuffle", &GridShuffler::shuffle)
+        .def("reset", &GridShuffler::reset)
+        .def("shuffle", &GridShuffler::shuffle, pybind11::call_guard<pybind11::gil_scoped_release>())
         .def("get_shuffled_grid", &GridShuffler::getShuffledGrid)
+        .def("get_shuffled_sources", &GridShuffler::getShuffledSources)
         .def("validate_result", &GridShuffler::validateResult);
+
+    m.def("read_csv", &readCsv, "Read a CSV file into a grid of strings",
+          pybind11::call_guard<pybind11::gil_scoped_release>());
 }
\ No newline at end of file
@@ -1,30 +1,96 @@
 #pragma once
 #include <string>
-#include <format>
 #include <vector>
 #include <unordered_map>
-#include <unordered_set>
 #include <utility>
-#include <ranges>
+#include <deque>
+#include <bit>
+#include <cstdint>
+#include <limits>
 #include <algorithm>
+#include <numeric>
 #include <random>
 
 using Position = std::pair<int, int>;
 using Grid = std::vector<std::vector<std::string>>;
 
-struct PositionHash {
-    size_t operator()(const Position& p) const {
-        return std::hash<int>()(p.first) ^ std::hash<int>()(p.second) << 1;
+/**
+ * @brief Set of token ids packed into 64-bit words
+ *
+ */
+class TokenSet {
+    std::vector<uint64_t> words;
+
+public:
+    TokenSet() = default;
+    explicit TokenSet(const size_t size, const bool filled = false) :
+        words((size + 63) / 64, filled? ~uint64_t{0}: 0)
+    {
+        if (filled && size % 64) words.back() >>= 64 - size % 64;
+    }
+
+    [[nodiscard]]
+    bool test(const size_t id) const
+    { return words[id >> 6] >> (id & 63) & 1; }
+
+    void set(const size_t id)
+    { words[id >> 6] |= uint64_t{1} << (id & 63); }
+
+    void reset(const size_t id)
+    { words[id >> 6] &= ~(uint64_t{1} << (id & 63)); }
+
+    [[nodiscard]]
+    size_t count() const {
+        size_t n = 0;
+        for (const uint64_t word : words) n += std::popcount(word);
+        return n;
+    }
+
+    [[nodiscard]]
+    bool none() const
+    { return std::ranges::all_of(words, [](const uint64_t word) { return word == 0; }); }
+
+    /**
+     * @brief Check whether the set holds an id other than the given one that is not in excluded
+     *
+     * @param excluded The ids to ignore
+     * @param id A single id to ignore as well
+     */
+    [[nodiscard]]
+    bool anyExcept(const TokenSet& excluded, const size_t id) const {
+        for (size_t w = 0; w < words.size(); w++) {
+            uint64_t rest = words[w] & ~excluded.words[w];
+            if (w == id >> 6) rest &= ~(uint64_t{1} << (id & 63));
+            if (rest) return true;
+        }
+        return false;
+    }
+
+    /** Call f with every id in the set, in increasing order */
+    template <typename F>
+    void forEach(F&& f) const {
+        for (size_t w = 0; w < words.size(); w++) {
+            for (uint64_t word = words[w]; word; word &= word - 1) {
+                f(w * 64 + std::countr_zero(word));
+            }
+        }
     }
 };
 
 class GridShuffler {
-    Grid original_grid, shuffled_grid;
-    std::vector<Position> non_empty_positions;
-    std::unordered_map<std::string, std::unordered_set<std::string>> forbidden_neighbors;
-    std::unordered_map<Position, std::vector<Position>, PositionHash> neighbors_map;
-    std::unordered_map<Position, std::string, PositionHash> assignment;
-    std::unordered_map<std::string, Position> original_positions;
+    Grid original_grid;
+    std::vector<Position> non_empty_positions;          // 座位編號 -> 格子座標
+    std::vector<std::string> tokens;                    // token id -> 名字
+    std::vector<int> original_tokens;                   // 座位編號 -> 原本坐在那裡的 token id
+    std::vector<size_t> original_positions;             // token id -> 原本的座位編號
+    std::vector<std::vector<size_t>> neighbors_map;     // 座位編號 -> 相鄰座位編號
+    std::vector<TokenSet> forbidden_neighbors;          // token id -> 不能相鄰的 token
+    std::vector<int> assignment;                        // 座位編號 -> token id，-1 代表未分配
+    std::vector<TokenSet> domains;                      // 座位編號 -> 仍可放的 token
+    std::vector<TokenSet> initial_domains;              // AC-3 之後的 domains，每次打亂都從這裡開始
+    std::vector<int> candidates;                        // 嘗試 token 的順序
+    bool consistent;                                    // AC-3 是否留下可行的 domains
+    std::vector<std::pair<size_t, int>> trail;          // 前向檢查刪除過的 (座位編號, token)，用於回溯
     uint64_t rows, cols;
 
 public:
@@ -38,102 +104,139 @@ public:
         rows(grid.size()),
         cols(rows > 0? grid[0].size(): 0)
     {
-        shuffled_grid = std::vector(rows, std::vector<std::string>(cols, ""));
-        buildForbiddenNeighbors();
         buildNonEmptyPositions();
         buildNeighborsMap();
+        buildForbiddenNeighbors();
         buildOriginalPositions();
+
+        buildInitialDomains();
+        consistent = ac3();
+        initial_domains = domains;
+
+        candidates.resize(tokens.size());
+        std::iota(candidates.begin(), candidates.end(), 0);
+        reset();
     }
 
 private:
     /**
-     * @brief Build the forbidden neighbors map based on the original grid
+     * @brief Build the list of non-empty positions and intern their names as token ids
      *
      */
-    void buildForbiddenNeighbors();
+    void buildNonEmptyPositions();
 
     /**
-     * @brief Build the list of non-empty positions in the grid
+     * @brief Build the neighbors map for each non-empty position
      *
      */
-    void buildNonEmptyPositions();
+    void buildNeighborsMap();
 
     /**
-     * @brief Build the neighbors map for each non-empty position
+     * @brief Build the forbidden neighbors set of every token based on the original grid
      *
      */
-    void buildNeighborsMap();
+    void buildForbiddenNeighbors();
 
     /**
-     * @brief Build the map of original positions for each digit
+     * @brief Build the map of original positions for each token
      *
      */
     void buildOriginalPositions();
 
     /**
-     * @brief Check if assigning a digit to a position is valid
+     * @brief Reset every domain to all tokens except the one originally seated there
+     *
+     */
+    void buildInitialDomains();
+
+    /**
+     * @brief Prune the domains with AC-3 over the constraints between adjacent positions
+     *
+     * @return true If every domain still holds at least one token
+     * @return false If some position has no token left
+     */
+    bool ac3();
+
+    /**
+     * @brief Remove from the domain of pos every token without a supporting token in the domain of neighbor
+     *
+     * @param pos The index of the position whose domain is revised
+     * @param neighbor The index of an adjacent position
+     * @return true If the domain of pos changed
+     * @return false If the domain of pos is unchanged
+     */
+    bool revise(size_t pos, size_t neighbor);
+
+    /**
+     * @brief Remove the tokens ruled out by assigning token to pos from the unassigned domains
+     *
+     * Every removal is pushed onto the trail so that it can be undone.
+     *
+     * @param pos The index of the assigned position
+     * @param token The assigned token
+     * @return true If every unassigned domain still holds at least one token
+     * @return false If some unassigned domain becomes empty
+     */
+    bool forwardCheck(size_t pos, int token);
+
+    /**
+     * @brief Restore the domain entries removed since the trail had the given size
      *
-     * @param pos The position to assign the digit to
-     * @param digit The digit to assign
-     * @param current_assignment The current assignment of digits to positions
-     * @return true If the assignment is valid
-     * @return false If the assignment is invalid
+     * @param trail_size The size of the trail before the removals
      */
-    bool isValidAssignment(
-        const Position& pos,
-        const std::string& digit,
-        const std::unordered_map<Position, std::string, PositionHash>& current_assignment);
+    void undoForwardCheck(size_t trail_size);
 
     /**
-     * @brief Backtracking algorithm to find a valid assignment of digits to positions
+     * @brief Backtracking algorithm to find a valid assignment of tokens to positions
      *
-     * @param current_assignment The current assignment of digits to positions
-     * @param possible_digits The possible digits for each position
-     * @param used_digits The set of digits that have already been used
+     * @param candidates All tokens, in the order they should be tried
+     * @param assigned The number of positions already assigned
      * @return true If a valid assignment is found
      * @return false If no valid assignment is found
      */
-    bool backtrack(std::unordered_map<Position, std::string, PositionHash>& current_assignment,
-                   std::unordered_map<Position, std::vector<std::string>, PositionHash>& possible_digits,
-                   std::unordered_set<std::string>& used_digits
-    ) {
-        if (current_assignment.size() == non_empty_positions.size()) return true;
-
-        const auto it = std::ranges::min_element(
-            non_empty_positions,
-            std::ranges::less{},
-            // 投影：如果元素已經在 current_assignment 中，就讓它「無限大」
-            [&](const Position& pos) -> size_t {
-                if (current_assignment.contains(pos))
-                    return std::numeric_limits<size_t>::max();
-                return possible_digits.at(pos).size();
+    bool backtrack(const std::vector<int>& candidates, const size_t assigned) {
+        if (assigned == non_empty_positions.size()) return true;
+
+        // MRV：選擇候選最少的空位
+        size_t pos = 0, min_size = std::numeric_limits<size_t>::max();
+        for (size_t p = 0; p < non_empty_positions.size(); p++) {
+            if (assignment[p] >= 0) continue;
+            if (const size_t size = domains[p].count(); size < min_size) {
+                pos = p;
+                min_size = size;
             }
-        );
-
-        if (it == non_empty_positions.end() || current_assignment.contains(*it)) return false;
-
-        const auto digits_to_try = possible_digits[*it];
-        for (const auto& digit : digits_to_try) {
-            if (used_digits.contains(digit)) continue; // 已使用過，跳過
+        }
 
-            if (isValidAssignment(*it, digit, current_assignment)) {
-                current_assignment[*it] = digit;
-                used_digits.insert(digit);
+        for (const int token : candidates) {
+            if (!domains[pos].test(token)) continue; // 已被排除，跳過
 
-                if (backtrack(current_assignment, possible_digits, used_digits)) {
-                    return true; // 找到有效分配，返回
-                }
+            const size_t trail_size = trail.size();
+            assignment[pos] = token;
 
-                // 回溯
-                current_assignment.erase(*it);
-                used_digits.erase(digit);
+            if (forwardCheck(pos, token) && backtrack(candidates, assigned + 1)) {
+                return true; // 找到有效分配，返回
             }
+
+            // 回溯
+            undoForwardCheck(trail_size);
+            assignment[pos] = -1;
         }
 
         return false; // 无有效分配，触发回溯
     }
 
 public:
+    /**
+     * @brief Clear the previous assignment so that the grid can be shuffled again
+     *
+     * The per-grid tables built by the constructor are kept.
+     */
+    void reset() {
+        assignment.assign(non_empty_positions.size(), -1);
+        trail.clear();
+        domains = initial_domains;
+    }
+
     /**
      * @brief Shuffle the grid according to the constraints
      *
@@ -141,33 +244,46 @@ public:
      * @return false If the grid cannot be shuffled
      */
     bool shuffle(){
-        std::unordered_map<Position, std::string, PositionHash> current_assignment;
-        std::unordered_map<Position, std::vector<std::string>, PositionHash> possible_digits;
-        std::unordered_set<std::string> used_digits;
-
         static std::random_device rd;
         static std::mt19937 mt{rd()};
 
-        const auto all_digits = forbidden_neighbors | std::views::keys | std::ranges::to<std::vector>();
+        reset();
+        if (!consistent) return false;
+        std::ranges::shuffle(candidates, mt);
 
-        for (const auto& pos : non_empty_positions) {
-            possible_digits[pos] = all_digits;
-        }
+        return backtrack(candidates, 0);
+    }
 
-        if (backtrack(current_assignment, possible_digits, used_digits)) {
-            for (const auto& [pos, digit] : current_assignment) {
-                const auto& [i, j] = pos;
-                shuffled_grid[i][j] = digit;
-            }
-            return true;
+    /** Get the shuffled grid */
+    [[nodiscard]]
+    Grid getShuffledGrid() const {
+        Grid shuffled_grid(rows, std::vector<std::string>(cols, ""));
+        for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+            if (assignment[pos] < 0) continue;
+            const auto& [i, j] = non_empty_positions[pos];
+            shuffled_grid[i][j] = tokens[assignment[pos]];
         }
-        return false;
+        return shuffled_grid;
     }
 
-    /** Get the shuffled grid */
+    /**
+     * @brief Get the shuffled grid as indices into the original grid
+     *
+     * @return std::vector<int> For every cell in row-major order, the row-major index of the original cell
+     *                          whose name now sits there; an empty cell maps to itself
+     */
     [[nodiscard]]
-    const Grid& getShuffledGrid() const
-    { return shuffled_grid; }
+    std::vector<int> getShuffledSources() const {
+        std::vector<int> sources(rows * cols);
+        std::iota(sources.begin(), sources.end(), 0);
+        for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+            if (assignment[pos] < 0) continue;
+            const auto& [i, j] = non_empty_positions[pos];
+            const auto& [oi, oj] = non_empty_positions[original_positions[assignment[pos]]];
+            sources[i * cols + j] = static_cast<int>(oi * cols + oj);
+        }
+        return sources;
+    }
 
     /**
      * @brief Validate the shuffled grid to ensure it meets all constraints
@@ -177,20 +293,20 @@ public:
      */
     [[nodiscard]]
     bool validateResult() const {
-        for (const auto& pos : non_empty_positions) {
-            const std::string& digit = shuffled_grid[pos.first][pos.second];
+        for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+            const int token = assignment[pos];
+            if (token < 0) return false;
 
-            for (const auto& [fst, snd] : neighbors_map.at(pos)) {
-                if (forbidden_neighbors.at(digit).contains(shuffled_grid[fst][snd])) {
+            for (const size_t neighbor : neighbors_map[pos]) {
+                if (const int other = assignment[neighbor];
+                    other < 0 || forbidden_neighbors[token].test(other)
+                ) {
                     return false;
                 }
             }
 
             // 检查原始位置的分配
-            if (auto it = original_positions.find(digit);
-                it != original_positions.end() &&
-                shuffled_grid[it->second.first][it->second.second] == digit
-            ) {
+            if (original_positions[token] == pos) {
                 return false;
             }
         }
@@ -199,37 +315,19 @@ public:
     }
 };
 
-inline void GridShuffler::buildForbiddenNeighbors()  {
-    std::vector<std::pair<int, int>> directions = {{-1, 0}, {1, 0}, {0, -1}, {0, 1}};
+inline void GridShuffler::buildNonEmptyPositions() {
+    std::unordered_map<std::string, int> token_ids;
 
     for (int i = 0; i < rows; i++) {
         for (int j = 0; j < cols; j++) {
             const std::string& tar = original_grid[i][j];
             if (tar.empty()) continue; // 跳过空位
 
-            forbidden_neighbors[tar] = std::unordered_set<std::string>();
+            const auto [it, inserted] = token_ids.try_emplace(tar, static_cast<int>(tokens.size()));
+            if (inserted) tokens.push_back(tar);
 
-            for (auto& [fst, snd] : directions) {
-                const int ni = i + fst;
-
-                if (const int nj = j + snd;
-                    ni >= 0 && ni < rows &&
-                    nj >= 0 && nj < cols &&
-                    !original_grid[ni][nj].empty()
-                ) {
-                    forbidden_neighbors[tar].insert(original_grid[ni][nj]);
-                }
-            }
-        }
-    }
-}
-
-inline void GridShuffler::buildNonEmptyPositions() {
-    for (int i = 0; i < rows; i++) {
-        for (int j = 0; j < cols; j++) {
-            if (!original_grid[i][j].empty()) {
-                non_empty_positions.emplace_back(i, j);
-            }
+            non_empty_positions.emplace_back(i, j);
+            original_tokens.push_back(it->second);
         }
     }
 }
@@ -237,9 +335,16 @@ inline void GridShuffler::buildNonEmptyPositions() {
 inline void GridShuffler::buildNeighborsMap() {
     std::vector<std::pair<int, int>> directions = {{-1, 0}, {1, 0}, {0, -1}, {0, 1}};
 
-    for (const auto& [i, j] : non_empty_positions) {
-        Position pos = {i, j};
-        neighbors_map[pos] = std::vector<Position>();
+    // 格子座標 -> 座位編號，空位为 -1
+    std::vector position_index(rows, std::vector<int>(cols, -1));
+    for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+        const auto& [i, j] = non_empty_positions[pos];
+        position_index[i][j] = static_cast<int>(pos);
+    }
+
+    neighbors_map.assign(non_empty_positions.size(), {});
+    for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+        const auto& [i, j] = non_empty_positions[pos];
 
         for (auto& [fst, snd] : directions) {
             const int ni = i + fst;
@@ -247,46 +352,110 @@ inline void GridShuffler::buildNeighborsMap() {
             if (const int nj = j + snd;
                 ni >= 0 && ni < rows &&
                 nj >= 0 && nj < cols &&
-                !original_grid[ni][nj].empty()
+                position_index[ni][nj] >= 0
             ) {
-                neighbors_map[pos].emplace_back(ni, nj);
+                neighbors_map[pos].push_back(position_index[ni][nj]);
             }
         }
     }
 }
 
-inline void GridShuffler::buildOriginalPositions() {
-    for (int i = 0; i < rows; i++) {
-        for (int j = 0; j < cols; j++) {
-            const std::string& tar = original_grid[i][j];
-            if (tar.empty()) continue;
+inline void GridShuffler::buildForbiddenNeighbors()  {
+    forbidden_neighbors.assign(tokens.size(), TokenSet(tokens.size()));
 
-            original_positions[tar] = {i, j};
+    for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+        for (const size_t neighbor : neighbors_map[pos]) {
+            forbidden_neighbors[original_tokens[pos]].set(original_tokens[neighbor]);
         }
     }
 }
 
-inline bool GridShuffler::isValidAssignment(
-    const Position& pos,
-    const std::string& digit,
-    const std::unordered_map<Position, std::string, PositionHash>& current_assignment)
-{
-    // 检查相邻位置的分配
-    for (const auto& neighbor : neighbors_map[pos]) {
-        auto it = current_assignment.find(neighbor);
-        if (it != current_assignment.end()) {
-            if (forbidden_neighbors.at(digit).contains(it->second)) {
-                return false; // 相邻位置有冲突
+inline void GridShuffler::buildOriginalPositions() {
+    original_positions.assign(tokens.size(), 0);
+
+    for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+        original_positions[original_tokens[pos]] = pos;
+    }
+}
+
+inline void GridShuffler::buildInitialDomains() {
+    domains.assign(non_empty_positions.size(), TokenSet(tokens.size(), true));
+
+    for (size_t token = 0; token < tokens.size(); token++) {
+        domains[original_positions[token]].reset(token); // 不能坐回原位
+    }
+}
+
+inline bool GridShuffler::ac3() {
+    std::deque<std::pair<size_t, size_t>> arcs;
+    for (size_t pos = 0; pos < non_empty_positions.size(); pos++) {
+        for (const size_t neighbor : neighbors_map[pos]) {
+            arcs.emplace_back(pos, neighbor);
+        }
+    }
+
+    while (!arcs.empty()) {
+        const auto [pos, neighbor] = arcs.front();
+        arcs.pop_front();
+
+        if (revise(pos, neighbor)) {
+            if (domains[pos].none()) return false;
+
+            for (const size_t other : neighbors_map[pos]) {
+                if (other != neighbor) arcs.emplace_back(other, pos);
             }
         }
     }
 
-    // 检查原始位置的分配
-    auto it = original_positions.find(digit);
-    if (it != original_positions.end() && it->second == pos) {
-        return false; // 原始位置有冲突
+    return true;
+}
+
+inline bool GridShuffler::revise(const size_t pos, const size_t neighbor) {
+    bool revised = false;
+    const TokenSet values = domains[pos];
+
+    values.forEach([&](const size_t token) {
+        // 相鄰位置需要一個不同、且不在禁止名單中的 token
+        if (!domains[neighbor].anyExcept(forbidden_neighbors[token], token)) {
+            domains[pos].reset(token);
+            revised = true;
+        }
+    });
+
+    return revised;
+}
+
+inline bool GridShuffler::forwardCheck(const size_t pos, const int token) {
+    // 每個 token 只能用一次
+    for (size_t other = 0; other < non_empty_positions.size(); other++) {
+        if (assignment[other] < 0 && domains[other].test(token)) {
+            domains[other].reset(token);
+            trail.emplace_back(other, token);
+        }
+    }
+
+    // 相鄰位置不能放禁止的 token
+    for (const size_t neighbor : neighbors_map[pos]) {
+        if (assignment[neighbor] >= 0) continue;
+
+        forbidden_neighbors[token].forEach([&](const size_t forbidden) {
+            if (domains[neighbor].test(forbidden)) {
+                domains[neighbor].reset(forbidden);
+                trail.emplace_back(neighbor, static_cast<int>(forbidden));
+            }
+        });
     }
 
-    return true; // 分配有效
+    for (size_t other = 0; other < non_empty_positions.size(); other++) {
+        if (assignment[other] < 0 && domains[other].none()) return false;
+    }
+    return true;
 }
 
+inline void GridShuffler::undoForwardCheck(const size_t trail_size) {
+    while (trail.size() > trail_size) {
+        const auto [pos, token] = trail.back();
+        trail.pop_back();
+        domains[pos].set(token);
+    }
+}
@@ -1,9 +1,12 @@
 #include <gtest/gtest.h>
 #include "../grid_shuffler_alg.hpp"
+#include "../csv_reader.hpp"
 #include <vector>
 #include <string>
 #include <algorithm>
 #include <print>
+#include <fstream>
+#include <filesystem>
 using namespace std;
 
 const Grid grid = {{"1","2","3"},{"4","5","6"},{"7","8","9"}};
@@ -38,6 +41,35 @@ TEST(GridAlgorithmTest, ValidateResult) {
     ASSERT_TRUE(shuffler.validateResult());
 }
 
+TEST(GridAlgorithmTest, SourcesMatchShuffledGrid) {
+    GridShuffler shuffler(grid);
+    ASSERT_TRUE(shuffler.shuffle());
+    const auto sources = shuffler.getShuffledSources();
+    const auto shuffled = shuffler.getShuffledGrid();
+    for (size_t k = 0; k < sources.size(); k++) {
+        ASSERT_EQ(shuffled[k / 3][k % 3], grid[sources[k] / 3][sources[k] % 3]);
+    }
+}
+
+TEST(GridAlgorithmTest, NoValidArrangement) {
+    // 中間的 2 無論坐哪裡都會與 1 或 3 相鄰
+    const Grid grid = {{"1","2","3"}};
+    GridShuffler shuffler(grid);
+    ASSERT_FALSE(shuffler.shuffle());
+}
+
+TEST(CsvReaderTest, ReadsQuotedAndRaggedRows) {
+    const auto path = std::filesystem::temp_directory_path() / "seat_allocator_test.csv";
+    std::ofstream(path, std::ios::binary) << "\xEF\xBB\xBF" "1,2,3\r\n\r\n\"4,\"\"5\"\"\",,6\n7\n";
+    const Grid expected = {{"1","2","3"},{"4,\"5\"","","6"},{"7","",""}};
+    ASSERT_EQ(readCsv(path), expected);
+    std::filesystem::remove(path);
+}
+
+TEST(CsvReaderTest, MissingFileThrows) {
+    ASSERT_THROW(readCsv("does_not_exist.csv"), std::runtime_error);
+}
+
 int main(int argc, char** argv) {
     testing::InitGoogleTest(&argc, argv);
     return RUN_ALL_TESTS();
@@ -1,21 +1,55 @@
+from array import array
+
 import grid_shuffler
 
 class Backend:
     def __init__(self):
-        pass
+        self._gs: grid_shuffler.GridShuffler | None = None
+        self._cells: list[str] = []
+        self._cols = 0
 
-    @staticmethod
-    def allocate_seats(seating_chart: list[list[str]]) -> list[list[str]]:
-        gs = grid_shuffler.GridShuffler(seating_chart)
-        if not gs.shuffle() or not gs.validate_result():
+    def prepare(self, seating_chart: list[list[str]]) -> None:
+        """
+        Build the shuffler for a newly loaded chart, so that repeated shuffles reuse its constraint tables.
+        :param seating_chart: the original seating chart
+        :return: Nothing.
+        """
+        self._gs = grid_shuffler.GridShuffler(seating_chart)
+        self._cells = [cell for row in seating_chart for cell in row]
+        self._cols = len(seating_chart[0]) if seating_chart else 0
+
+    def original_record(self) -> array:
+        """
+        :return: the record of the chart passed to prepare, in the format returned by allocate_seats.
+        """
+        return self._to_record(range(len(self._cells)))
+
+    def allocate_seats(self) -> array:
+        """
+        Shuffle the prepared chart.
+        :return: the row-major index of the original cell now sitting in each cell; pass it to materialize.
+        """
+        if self._gs is None or not self._gs.shuffle() or not self._gs.validate_result():
             raise RuntimeError("排序失敗，請重試")
-        return gs.get_shuffled_grid()
+        return self._to_record(self._gs.get_shuffled_sources())
+
+    def materialize(self, record: array) -> list[list[str]]:
+        """
+        Rebuild the seating chart described by a record.
+        :param record: a record returned by allocate_seats or original_record
+        :return: the chart, referencing the original name strings
+        """
+        cells, cols = self._cells, self._cols
+        seats = [cells[k] for k in record]
+        return [seats[i:i + cols] for i in range(0, len(seats), cols)]
+
+    def _to_record(self, sources) -> array:
+        # Two bytes per seat unless the chart is too large to index with uint16
+        return array('H' if len(self._cells) <= 0xFFFF else 'I', sources)
 
     @staticmethod
     def read_csv(file_path: str) -> list[list[str]]:
-        import pandas as pd
         try:
-            df = pd.read_csv(file_path, header=None, dtype=str, engine='c')
-            return df.fillna('').values.tolist()
+            return grid_shuffler.read_csv(file_path)
         except Exception as e:
             raise RuntimeError(f"Error reading CSV file: {e}")
@@ -1,23 +1,99 @@
-from PyQt6.QtWidgets import QApplication, QWidget, QFileDialog, QTableWidgetItem, QHeaderView, QMessageBox
-from PyQt6.QtCore import Qt
+from PyQt6.QtWidgets import QApplication, QWidget, QFileDialog, QHeaderView, QMessageBox
+from PyQt6.QtCore import (Qt, QAbstractTableModel, QModelIndex, QSignalBlocker, QObject, QRunnable, QThreadPool,
+                          pyqtSignal)
 from PyQt6.QtGui import QFont
 from widget import Ui_Widget
 from backend import Backend
 
+from array import array
+import csv
+import logging
 import sys
 import os
 
+logger = logging.getLogger(__name__)
+
+class SeatTableModel(QAbstractTableModel):
+    """
+    Table model serving one seating chart to the seat_viewer.
+    Cells are only queried by the view when they are painted.
+    """
+    _CELL_ALIGN = Qt.AlignmentFlag.AlignCenter
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._data: list[list[str]] = []
+
+    def set_grid(self, data: list[list[str]]) -> None:
+        """
+        Replace the displayed grid with a single model reset.
+        :param data: the seating chart to display
+        :return: Nothing.
+        """
+        self.beginResetModel()
+        self._data = data
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._data)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() or not self._data else len(self._data[0])
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._data[index.row()][index.column()]
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return SeatTableModel._CELL_ALIGN
+        return None
+
+
+class _WorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+
+class _Worker(QRunnable):
+    """
+    Run a function on the global thread pool and report its result through signals.
+    """
+    def __init__(self, fn, *args):
+        super().__init__()
+        self.signals = _WorkerSignals()
+        self._fn = fn
+        self._args = args
+
+    def run(self) -> None:
+        try:
+            result = self._fn(*self._args)
+        except RuntimeError as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
+
+
 class App(QWidget, Ui_Widget):
     def __init__(self):
         super().__init__()
         self.setFixedSize(1000,750)
-        self.__data: list[list[list[str]]] = []
+        # Records from Backend: index 0 is the original chart, the rest are shuffles
+        self.__data: list[array] = []
+        self.__backend = Backend()
         self.setupUi(self)
+        self.__model = SeatTableModel(self)
+        self.seat_viewer.setModel(self.__model)
+        self.seat_viewer.setFont(QFont("Microsoft JhengHei", 16))
+        # The table fills its whole viewport, so Qt can skip erasing the background on repaint.
+        self.seat_viewer.viewport().setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent, True)
+        self.seat_viewer.setAttribute(Qt.WidgetAttribute.WA_StaticContents, True)
         self.setWindowTitle("Seat Allocator")
         self.csv_import.clicked.connect(self.__read_file)
 
-        self.seat_viewer.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        self.seat_viewer.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        # Sections are sized once per chart in __fit_sections instead of on every layout pass;
+        # the last section absorbs the remainder of the integer division.
+        for header in (self.seat_viewer.horizontalHeader(), self.seat_viewer.verticalHeader()):
+            header.setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+            header.setStretchLastSection(True)
 
         self.tab_display.removeTab(0)
         self.tab_display.setTabText(0, "原始")
@@ -45,19 +121,27 @@ class App(QWidget, Ui_Widget):
             return
 
         print(f"Selected file: {file_path}")
-        data = Backend.read_csv(file_path)
+        self.__start_worker(_Worker(Backend.read_csv, file_path), lambda data: self.__load_data(data, file_path))
+
+    #  --------------------------------------------------------------------------
+    def __load_data(self, data: list[list[str]], file_path: str) -> None:
+        """
+        Replace the current records with the data read from a CSV file.
+        :param data: the seating chart read from the file
+        :param file_path: the path of the file it was read from
+        :return: Nothing. It only updates the UI.
+        """
         if data:
-            print("CSV Data:")
+            logger.debug("loaded %d rows x %d cols", len(data), len(data[0]))
             # 清空 __data
             self.__delete_all(True)
-            self.__data.append(data)
+            self.__backend.prepare(data)
+            self.__data.append(self.__backend.original_record())
 
             self.begin_shuffle.setEnabled(True)
             self.csv_import.setText(f"{os.path.basename(file_path)}")
             self.csv_import_state.setText("已導入")
             self.__display_data(0)
-            for row in data:
-                print(row)
         else:
             QMessageBox.warning(self, "錯誤", "讀取 CSV 檔案失敗。")
 
@@ -70,18 +154,25 @@ class App(QWidget, Ui_Widget):
         :return: Nothing. It only updates the UI.
         """
         if 0 <= index < len(self.__data) and self.__data:
-            data = self.__data[index]
-            row = len(data)
-            col = len(data[0]) if row > 0 else 0
-            self.seat_viewer.setRowCount(row)
-            self.seat_viewer.setColumnCount(col)
-
-            for i in range(row):
-                for j in range(col):
-                    item = QTableWidgetItem(data[i][j])
-                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                    item.setFont(QFont("Microsoft JhengHei", 16))
-                    self.seat_viewer.setItem(i, j, item)
+            self.seat_viewer.setUpdatesEnabled(False)
+            self.__model.set_grid(self.__backend.materialize(self.__data[index]))
+            self.__fit_sections()
+            self.seat_viewer.setUpdatesEnabled(True)
+
+    #  --------------------------------------------------------------------------
+    def __fit_sections(self) -> None:
+        """
+        Size the rows and columns so that the displayed grid fills the seat_viewer viewport.
+        :return: Nothing. It only updates the UI.
+        """
+        viewport = self.seat_viewer.viewport()
+        self.seat_viewer.horizontalHeader().setDefaultSectionSize(viewport.width() // max(self.__model.columnCount(), 1))
+        self.seat_viewer.verticalHeader().setDefaultSectionSize(viewport.height() // max(self.__model.rowCount(), 1))
+
+    #  --------------------------------------------------------------------------
+    def resizeEvent(self, event) -> None:
+        super().resizeEvent(event)
+        self.__fit_sections()
 
     #  --------------------------------------------------------------------------
     def __begin_shuffling(self) -> None:
@@ -92,15 +183,58 @@ class App(QWidget, Ui_Widget):
         :return: Nothing. It only updates the UI.
         """
         assert self.__data, "Data is empty"
-        target_data = self.__data[0]
-        try:
-            shuffled_data = Backend.allocate_seats(target_data)
-            self.__data.append(shuffled_data)
-            self.tab_display.addTab(QWidget(), f"第{len(self.__data)-1}次打亂")
-            self.tab_display.setCurrentIndex(len(self.__data)-1)
-            self.__display_data(len(self.__data)-1)
-        except RuntimeError as e:
-            QMessageBox.critical(self, "錯誤", str(e))
+        self.__start_worker(_Worker(self.__backend.allocate_seats), self.__add_shuffled)
+
+    #  --------------------------------------------------------------------------
+    def __add_shuffled(self, record: array) -> None:
+        """
+        Add a shuffled chart as a new record and show it.
+        :param record: the record returned by allocate_seats
+        :return: Nothing. It only updates the UI.
+        """
+        self.__data.append(record)
+        self.tab_display.addTab(QWidget(), f"第{len(self.__data)-1}次打亂")
+        self.tab_display.setCurrentIndex(len(self.__data)-1)
+        self.__display_data(len(self.__data)-1)
+
+    #  --------------------------------------------------------------------------
+    def __start_worker(self, worker: _Worker, on_finished) -> None:
+        """
+        Run a worker on the global thread pool, keeping the buttons disabled until it reports back.
+        :param worker: the worker to run
+        :param on_finished: called on the GUI thread with the worker's result
+        :return: Nothing.
+        """
+        self.__set_busy(True)
+        worker.signals.finished.connect(lambda _: self.__set_busy(False))
+        worker.signals.finished.connect(on_finished)
+        worker.signals.error.connect(self.__on_worker_error)
+        QThreadPool.globalInstance().start(worker)
+
+    #  --------------------------------------------------------------------------
+    def __on_worker_error(self, message: str) -> None:
+        """
+        Report a failed background task.
+        :param message: the error message raised by the backend
+        :return: Nothing. It only updates the UI.
+        """
+        self.__set_busy(False)
+        QMessageBox.critical(self, "錯誤", message)
+
+    #  --------------------------------------------------------------------------
+    def __set_busy(self, busy: bool) -> None:
+        """
+        Toggle the busy state while a background task is running.
+        :param busy: whether a task is running
+        :return: Nothing. It only updates the UI.
+        """
+        for button in (self.csv_import, self.delete_all_button, self.export_button):
+            button.setEnabled(not busy)
+        self.begin_shuffle.setEnabled(not busy and bool(self.__data))
+        if busy:
+            QApplication.setOverrideCursor(Qt.CursorShape.BusyCursor)
+        else:
+            QApplication.restoreOverrideCursor()
 
     #  --------------------------------------------------------------------------
     def __delete_all(self, delete_first: bool = False) -> None:
@@ -110,11 +244,12 @@ class App(QWidget, Ui_Widget):
         """
         if not self.__data:
             return
-        self.__display_data(0)
         self.__data = [] if delete_first else self.__data[:1]
-        self.tab_display.setCurrentIndex(0)
-        while self.tab_display.count() > 1:
-            self.tab_display.removeTab(1)
+        with QSignalBlocker(self.tab_display):
+            self.tab_display.setCurrentIndex(0)
+            while self.tab_display.count() > 1:
+                self.tab_display.removeTab(1)
+        self.__display_data(0)
 
     #  --------------------------------------------------------------------------
     def __confirm_delete_all(self) -> None:
@@ -142,15 +277,15 @@ class App(QWidget, Ui_Widget):
             print("Failed to save CSV data.")
             return
         try:
-            import pandas as pd
-            df = pd.DataFrame(self.__data[current])
-            df.to_csv(file_path, header=False, index=False)
+            with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(self.__backend.materialize(self.__data[current]))
             QMessageBox.information(self, "成功", f"已成功把第{current}次打亂記錄匯出至{file_path}")
             print(f"Data exported to {file_path}")
         except Exception as e:
             print(f"Error exporting CSV file: {e}")
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
     app = QApplication(sys.argv)
     window = App()
     window.show()
@@ -1,3 +1,4 @@
+import logging
 import unittest
 
 class TestGridShuffler(unittest.TestCase):
@@ -9,8 +10,9 @@ class TestGridShuffler(unittest.TestCase):
     def test_read_csv(self):
         import backend
         seating_chart = backend.Backend.read_csv('test.csv')
+        logging.getLogger(__name__).debug("loaded %d rows x %d cols", len(seating_chart),
+                                          len(seating_chart[0]) if seating_chart else 0)
         for row in seating_chart:
-            print(row)
             self.assertIsInstance(row, list)
             for seat in row:
                 self.assertIsInstance(seat, str)